@@ -0,0 +1,339 @@
+"""
+I applied late-arriving leads and purchases without rebuilding the mart.
+
+Purchases can land up to weeks after the lead (generate_events_and_outcomes
+places them up to 15 days later), so a full rebuild of
+gold.mart_funnel_journey for every late batch does not scale. Instead I:
+- landed every new row (idempotent on ids) in bronze and as a parquet file
+  under data/raw/late, which build_warehouse.py reads next to the main raw
+  files, so a later full rebuild keeps it
+- appended the new fact_lead / fact_purchase rows to silver
+- looked up the affected journeys with an IN-list probe on customer_id,
+  which the mart is indexed on, then matched vehicle_id
+- recomputed only those journeys' lead/purchase columns
+- adjusted gold.agg_funnel_daily by the resulting deltas instead of
+  re-aggregating, and mirrored the row changes into the sampled mart
+- ran detect_anomalies.py after the commit, which re-scores the cohorts the
+  late rows touch
+
+Rows older than the lateness horizon (NAV_LATENESS_HORIZON_DAYS) were
+landed but not applied to silver or gold; they were reported in
+outputs/late_data_report.json and are picked up by the next full rebuild.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from datetime import datetime, timezone
+
+import duckdb
+
+import detect_anomalies
+
+DB_PATH = os.environ.get("NAV_DB_PATH", "data/processed/navigator.duckdb")
+
+LATE_LEADS = os.environ.get("NAV_LATE_LEADS")
+LATE_PURCHASES = os.environ.get("NAV_LATE_PURCHASES")
+LATENESS_HORIZON_DAYS = int(os.environ.get("NAV_LATENESS_HORIZON_DAYS", 30))
+REPORT_PATH = "outputs/late_data_report.json"
+# build_warehouse.py reads data/raw/late/raw_<source>_*.parquet into bronze.
+LANDING_DIR = "data/raw/late"
+MAX_REPORTED_ROWS = 100
+
+# Beyond this many affected customers an IN-list stops being a cheap probe,
+# so I matched journeys with a semi join (one scan of the mart) instead.
+MAX_INDEX_PROBES = int(os.environ.get("NAV_LATE_MAX_PROBES", 2048))
+
+OUTCOME_COLUMNS = [
+    "lead_ts",
+    "purchase_ts",
+    "purchase_price",
+    "reached_lead",
+    "reached_purchase",
+    "mins_to_purchase",
+]
+
+# I conformed late rows exactly like pipelines/sql/models.sql does for silver.
+SOURCES = {
+    "lead": {
+        "raw": "raw_leads",
+        "target": "silver.fact_lead",
+        "id": "lead_id",
+        "ts": "lead_ts",
+        "select": """
+            lead_id,
+            customer_id,
+            vehicle_id,
+            cast(lead_ts as timestamp) as lead_ts,
+            lead_type,
+            campaign_id
+        """,
+    },
+    "purchase": {
+        "raw": "raw_purchases",
+        "target": "silver.fact_purchase",
+        "id": "purchase_id",
+        "ts": "purchase_ts",
+        "select": """
+            purchase_id,
+            customer_id,
+            vehicle_id,
+            cast(purchase_ts as timestamp) as purchase_ts,
+            purchase_price
+        """,
+    },
+}
+
+
+def _landed_path(name: str, as_of: datetime) -> str:
+    return os.path.join(LANDING_DIR, f"{SOURCES[name]['raw']}_{as_of:%Y%m%dT%H%M%S%fZ}.parquet")
+
+
+def _stage(con: duckdb.DuckDBPyConnection, name: str, path: str, as_of: datetime) -> dict:
+    """
+    I staged one late file into a temp table, dropped rows already in bronze,
+    landed the rest in bronze and data/raw/late, and split it by the lateness
+    horizon before appending to silver.
+    """
+    src = SOURCES[name]
+    bronze = f"bronze.{src['raw']}"
+    con.execute(f"""
+        create or replace temp table late_raw_{name} as
+        select r.*
+        from read_parquet(?) r
+        anti join {bronze} b on b.{src['id']} = r.{src['id']}
+    """, [path])
+    con.execute(f"""
+        create or replace temp table late_{name} as
+        select
+          r.*,
+          r.{src['ts']} < cast(? as timestamp) - to_days(?) as past_horizon
+        from (select {src['select']} from late_raw_{name}) r
+    """, [as_of.replace(tzinfo=None), LATENESS_HORIZON_DAYS])
+
+    received = con.execute("select count(*) from read_parquet(?)", [path]).fetchone()[0]
+    staged, past = con.execute(
+        f"select count(*), count(*) filter (where past_horizon) from late_{name}"
+    ).fetchone()
+    past_rows = con.execute(f"""
+        select {src['id']}, customer_id, vehicle_id, cast({src['ts']} as varchar) as ts,
+               datediff('day', {src['ts']}, cast(? as timestamp)) as lateness_days
+        from late_{name}
+        where past_horizon
+        order by {src['ts']}
+        limit {MAX_REPORTED_ROWS}
+    """, [as_of.replace(tzinfo=None)]).fetchall()
+
+    landed = None
+    if staged:
+        con.execute(f"insert into {bronze} by name select * from late_raw_{name}")
+        landed = _landed_path(name, as_of)
+        os.makedirs(LANDING_DIR, exist_ok=True)
+        con.execute(f"copy late_raw_{name} to '{landed}' (format parquet)")
+
+    con.execute(f"""
+        insert into {src['target']}
+        select * exclude (past_horizon) from late_{name} where not past_horizon
+    """)
+
+    return {
+        "file": path,
+        "landed": landed,
+        "received": int(received),
+        "duplicates_skipped": int(received - staged),
+        "applied": int(staged - past),
+        "past_horizon": int(past),
+        "past_horizon_rows": [
+            {"id": r[0], "customer_id": r[1], "vehicle_id": r[2], "ts": r[3], "lateness_days": r[4]}
+            for r in past_rows
+        ],
+    }
+
+
+def _customer_filter(customers: list) -> tuple:
+    """
+    I matched journeys on an IN-list of customer ids, which DuckDB answers
+    from idx_mart_funnel_journey_customer; it does not probe the index through
+    a join, and falls back to a scan on its own when a probe would match too
+    many rows.
+    """
+    if not customers:
+        return "false", []
+    if len(customers) > MAX_INDEX_PROBES:
+        return "customer_id in (select customer_id from late_keys)", []
+    return f"customer_id in ({', '.join('?' * len(customers))})", customers
+
+
+def _apply_to_gold(con: duckdb.DuckDBPyConnection, staged: list) -> dict:
+    """I recomputed outcomes for the affected journeys and applied them by delta."""
+    key_sources = " union ".join(
+        f"select customer_id, vehicle_id from late_{name} where not past_horizon"
+        for name in staged
+    )
+    con.execute(f"create or replace temp table late_keys as {key_sources};")
+    customers = [
+        r[0] for r in con.execute(
+            "select distinct customer_id from late_keys where customer_id is not null order by 1"
+        ).fetchall()
+    ]
+    probe, params = _customer_filter(customers)
+
+    # A plain filtered select keeps the lookup an index scan.
+    con.execute(f"""
+        create or replace temp table late_journeys as
+        select * from gold.mart_funnel_journey where {probe};
+    """, params)
+
+    # Outcomes use the same definitions as the mart's lead / purchase CTEs,
+    # restricted to the affected (customer_id, vehicle_id) keys.
+    con.execute("""
+        create or replace temp table late_changes as
+        with lead as (
+          select l.customer_id, l.vehicle_id, min(l.lead_ts) as lead_ts
+          from silver.fact_lead l
+          semi join late_keys k on k.customer_id = l.customer_id and k.vehicle_id = l.vehicle_id
+          group by 1, 2
+        ),
+        purchase as (
+          select p.customer_id, p.vehicle_id, min(p.purchase_ts) as purchase_ts,
+                 any_value(p.purchase_price) as purchase_price
+          from silver.fact_purchase p
+          semi join late_keys k on k.customer_id = p.customer_id and k.vehicle_id = p.vehicle_id
+          group by 1, 2
+        ),
+        journeys as (
+          select j.*
+          from late_journeys j
+          semi join late_keys k on k.customer_id = j.customer_id and k.vehicle_id = j.vehicle_id
+        )
+        select
+          j.journey_id,
+          cast(j.first_browse_ts as date) as event_date,
+          j.experiment_id,
+          j.variant,
+          j.reached_eligibility,
+          j.reached_lead as old_reached_lead,
+          j.reached_purchase as old_reached_purchase,
+          j.mins_to_purchase as old_mins_to_purchase,
+          l.lead_ts,
+          p.purchase_ts,
+          p.purchase_price,
+          case when l.lead_ts is not null then 1 else 0 end as reached_lead,
+          case when p.purchase_ts is not null then 1 else 0 end as reached_purchase,
+          case when p.purchase_ts is not null then datediff('minute', j.first_browse_ts, p.purchase_ts) end as mins_to_purchase
+        from journeys j
+        left join lead l on l.customer_id = j.customer_id and l.vehicle_id = j.vehicle_id
+        left join purchase p on p.customer_id = j.customer_id and p.vehicle_id = j.vehicle_id;
+    """)
+
+    # I set each column with a correlated lookup instead of UPDATE ... FROM,
+    # which DuckDB plans as a hash join over a full scan of the mart.
+    assignments = ",\n".join(
+        f"{col} = (select c.{col} from late_changes c where c.journey_id = m.journey_id)"
+        for col in OUTCOME_COLUMNS
+    )
+    for table in ["gold.mart_funnel_journey", "gold.mart_funnel_journey_sample"]:
+        con.execute(f"""
+            update {table} m
+            set {assignments}
+            where {probe}
+              and exists (select 1 from late_changes c where c.journey_id = m.journey_id);
+        """, params)
+
+    con.execute("""
+        update gold.agg_funnel_daily a
+        set lead_journeys = a.lead_journeys + d.d_lead,
+            purchase_journeys = a.purchase_journeys + d.d_purchase,
+            eligible_lead_journeys = a.eligible_lead_journeys + d.d_eligible_lead,
+            lead_purchase_journeys = a.lead_purchase_journeys + d.d_lead_purchase,
+            sum_mins_to_purchase = case
+              when a.purchase_journeys + d.d_purchase = 0 then null
+              else coalesce(a.sum_mins_to_purchase, 0) + d.d_mins_to_purchase
+            end
+        from (
+          select
+            event_date,
+            experiment_id,
+            variant,
+            sum(reached_lead - old_reached_lead) as d_lead,
+            sum(reached_purchase - old_reached_purchase) as d_purchase,
+            sum(reached_eligibility * (reached_lead - old_reached_lead)) as d_eligible_lead,
+            sum(reached_lead * reached_purchase - old_reached_lead * old_reached_purchase) as d_lead_purchase,
+            sum(coalesce(mins_to_purchase, 0) - coalesce(old_mins_to_purchase, 0)) as d_mins_to_purchase
+          from late_changes
+          group by 1, 2, 3
+        ) d
+        where a.event_date = d.event_date
+          and a.experiment_id is not distinct from d.experiment_id
+          and a.variant is not distinct from d.variant;
+    """)
+
+    keys, journeys, changed = con.execute("""
+        select
+          (select count(*) from late_keys),
+          count(*),
+          count(*) filter (where reached_lead <> old_reached_lead
+                              or reached_purchase <> old_reached_purchase
+                              or mins_to_purchase is distinct from old_mins_to_purchase)
+        from late_changes
+    """).fetchone()
+    return {"affected_keys": int(keys), "journeys_recomputed": int(journeys), "journeys_changed": int(changed)}
+
+
+def main() -> None:
+    files = {"lead": LATE_LEADS, "purchase": LATE_PURCHASES}
+    files = {name: path for name, path in files.items() if path}
+    if not files:
+        raise ValueError("Set NAV_LATE_LEADS and/or NAV_LATE_PURCHASES to a late-arriving parquet file")
+
+    landing = os.path.abspath(LANDING_DIR)
+    for path in files.values():
+        if os.path.dirname(os.path.abspath(path)) == landing:
+            raise ValueError(f"{path} is already landed in {LANDING_DIR}; apply it from elsewhere")
+
+    as_of = datetime.now(timezone.utc)
+    con = duckdb.connect(DB_PATH)
+    try:
+        con.execute("begin transaction;")
+        try:
+            sources = {name: _stage(con, name, path, as_of) for name, path in files.items()}
+            gold = _apply_to_gold(con, list(files))
+            con.execute("commit;")
+        except Exception:
+            con.execute("rollback;")
+            # A landed file without its bronze rows would be double-counted
+            # once the batch is retried, so I removed it with the transaction.
+            for name in files:
+                landed = _landed_path(name, as_of)
+                if os.path.exists(landed):
+                    os.remove(landed)
+            raise
+
+        # I ran the anomaly detector as part of the load, so cohorts the late
+        # rows touch are re-scored (and new alerts raised) right away.
+        anomalies = detect_anomalies.run(con)
+    finally:
+        con.close()
+
+    report = {
+        "as_of": as_of.isoformat(),
+        "lateness_horizon_days": LATENESS_HORIZON_DAYS,
+        "sources": sources,
+        "gold": gold,
+        "anomalies": anomalies,
+    }
+    os.makedirs("outputs", exist_ok=True)
+    with open(REPORT_PATH, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+
+    past = sum(s["past_horizon"] for s in sources.values())
+    print(
+        f"Applied late data to {gold['journeys_changed']} journeys "
+        f"({past} rows past the {LATENESS_HORIZON_DAYS}-day horizon); report at {REPORT_PATH}"
+    )
+    print(detect_anomalies.describe(anomalies))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,11 +5,22 @@ versioned SQL definitions in pipelines/sql.
 
 This gave me a reproducible local environment to validate the funnel,
 KPIs, and experiment readouts end-to-end.
+
+For large builds I added a resource-governed mode (enabled by setting
+NAV_MEMORY_LIMIT) that caps DuckDB memory and threads, spills to disk,
+and allows per-model overrides. The thread, spill directory and spill size
+settings also apply on their own. If the funnel mart still exceeds its
+budget, I rebuilt it in actor-hash buckets so the build completes under
+a fixed RAM cap.
 """
 
 from __future__ import annotations
 
+import glob
 import os
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
 import duckdb
 
 DB_PATH = os.environ.get("NAV_DB_PATH", "data/processed/navigator.duckdb")
@@ -21,10 +32,225 @@ RAW_ELIG = "data/raw/raw_eligibility_decisions.parquet"
 RAW_LEADS = "data/raw/raw_leads.parquet"
 RAW_PURCHASES = "data/raw/raw_purchases.parquet"
 
+# Late batches landed by apply_late_data.py, read alongside the main raw files.
+RAW_LATE_DIR = "data/raw/late"
+
+SQL_FILES = [
+    "pipelines/sql/models.sql",
+    "pipelines/sql/kpis.sql",
+    "pipelines/sql/samples.sql",
+]
+
+# Resource governance (all optional; unset means DuckDB defaults).
+MEMORY_LIMIT = os.environ.get("NAV_MEMORY_LIMIT")
+THREADS = os.environ.get("NAV_THREADS")
+# The spill directory defaults to DEFAULT_TEMP_DIR under a memory limit and
+# to DuckDB's own (next to the database file) otherwise.
+TEMP_DIR = os.environ.get("NAV_TEMP_DIR")
+DEFAULT_TEMP_DIR = "data/processed/duckdb_tmp"
+MAX_TEMP_DIR_SIZE = os.environ.get("NAV_MAX_TEMP_DIR_SIZE")
+
+# Per-model overrides, e.g. "gold.mart_funnel_journey=2GB,silver.fact_events=1GB".
+MODEL_MEMORY_LIMITS = os.environ.get("NAV_MODEL_MEMORY_LIMITS", "")
+MODEL_THREADS = os.environ.get("NAV_MODEL_THREADS", "")
+
+# Actor-hash bucketing used when a model exceeds its memory budget.
+BUCKETED_MODELS = {"gold.mart_funnel_journey"}
+DEFAULT_BUCKETS = int(os.environ.get("NAV_BUCKETS", 8))
+MAX_BUCKETS = int(os.environ.get("NAV_MAX_BUCKETS", 256))
+
+# I filtered every source of the mart on the same actor key so that each
+# bucket holds complete journeys and their matching outcomes.
+BUCKET_KEYS = {
+    "silver.fact_events": "coalesce(customer_id, anonymous_id)",
+    "silver.fact_eligibility_decision": "customer_id",
+    "silver.fact_lead": "customer_id",
+    "silver.fact_purchase": "customer_id",
+}
+
+_CREATE_TABLE = re.compile(
+    r"^\s*create\s+(?:or\s+replace\s+)?(?:table|view)\s+([\w.]+)\s+as\s+",
+    re.IGNORECASE | re.MULTILINE,
+)
+_CREATE_INDEX = re.compile(
+    r"^\s*create\s+(?:unique\s+)?index\s+(?:if\s+not\s+exists\s+)?\w+\s+on\s+([\w.]+)",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def _parse_overrides(raw: str, models: Set[str]) -> Dict[str, str]:
+    """
+    I parsed "model=value,model=value" override strings from the environment,
+    rejecting models the SQL files do not build so a typo cannot silently
+    leave a model uncapped.
+    """
+    overrides: Dict[str, str] = {}
+    for item in raw.split(","):
+        if not item.strip():
+            continue
+        model, _, value = item.partition("=")
+        if not value.strip():
+            raise ValueError(f"Invalid model override: {item!r}")
+        if model.strip() not in models:
+            raise ValueError(
+                f"Unknown model in override {item!r}; expected one of {', '.join(sorted(models))}")
+        overrides[model.strip()] = value.strip()
+    return overrides
+
+
+def _split_statements(sql: str) -> List[Tuple[Optional[str], str]]:
+    """
+    I split a versioned SQL file into statements and tagged each one with the
+    model it creates or indexes (None for drops and other housekeeping
+    statements), so index builds run under the same per-model budget.
+    """
+    statements = []
+    for stmt in re.split(r";\s*(?:\n|$)", sql):
+        if not stmt.strip():
+            continue
+        match = _CREATE_TABLE.search(stmt) or _CREATE_INDEX.search(stmt)
+        statements.append((match.group(1) if match else None, stmt))
+    return statements
+
+
+def _read_statements(path: str) -> List[Tuple[Optional[str], str]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return _split_statements(f.read())
+
+
+def _sql_models() -> Set[str]:
+    """I listed every model the versioned SQL files create or index."""
+    return {model for path in SQL_FILES for model, _ in _read_statements(path) if model}
+
+
+def _bucket_sql(select_sql: str, buckets: int, bucket: int) -> str:
+    """I restricted each mart source to a single actor-hash bucket."""
+    for table, key in BUCKET_KEYS.items():
+        select_sql = re.sub(
+            rf"\bfrom\s+{re.escape(table)}\b",
+            f"from (select * from {table} where hash({key}) % {buckets} = {bucket}) as {table.split('.')[-1]}",
+            select_sql,
+            flags=re.IGNORECASE,
+        )
+    return select_sql
+
+
+def _is_out_of_memory(exc: duckdb.Error) -> bool:
+    """
+    I treated commit-time allocation failures as out-of-memory too: when the
+    cap is hit while flushing an append, DuckDB raises a TransactionException
+    ("Failed to commit: could not allocate block ...") instead.
+    """
+    if isinstance(exc, duckdb.OutOfMemoryException):
+        return True
+    message = str(exc).lower()
+    return isinstance(exc, duckdb.TransactionException) and (
+        "could not allocate" in message or "out of memory" in message
+    )
+
+
+def _build_bucketed(con: duckdb.DuckDBPyConnection, model: str, stmt: str) -> int:
+    """
+    I rebuilt a model bucket by bucket, doubling the bucket count whenever a
+    single bucket still exceeded the memory budget. Returns the bucket count used.
+    """
+    match = _CREATE_TABLE.search(stmt)
+    select_sql = stmt[match.end():]
+    buckets = DEFAULT_BUCKETS
+
+    while True:
+        # I committed each bucket on its own; a single wrapping transaction
+        # would keep every appended bucket pinned in memory until commit.
+        con.execute(f"drop table if exists {model};")
+        try:
+            for bucket in range(buckets):
+                bucket_sql = _bucket_sql(select_sql, buckets, bucket)
+                if bucket == 0:
+                    con.execute(f"create table {model} as {bucket_sql}")
+                else:
+                    con.execute(f"insert into {model} {bucket_sql}")
+            return buckets
+        except (duckdb.OutOfMemoryException, duckdb.TransactionException) as exc:
+            if not _is_out_of_memory(exc):
+                raise
+            con.execute(f"drop table if exists {model};")
+            if buckets * 2 > MAX_BUCKETS:
+                raise
+            buckets *= 2
+
+
+def _raw_files(path: str) -> List[str]:
+    """I listed a raw file together with any late batches landed for the same source."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    return [path] + sorted(glob.glob(os.path.join(RAW_LATE_DIR, f"{name}_*.parquet")))
+
+
+def _configure(con: duckdb.DuckDBPyConnection) -> None:
+    """I applied the global resource settings for a governed build."""
+    temp_dir = TEMP_DIR or (DEFAULT_TEMP_DIR if MEMORY_LIMIT else None)
+    if temp_dir:
+        os.makedirs(temp_dir, exist_ok=True)
+        con.execute(f"set temp_directory = '{temp_dir}';")
+    if MAX_TEMP_DIR_SIZE:
+        con.execute(f"set max_temp_directory_size = '{MAX_TEMP_DIR_SIZE}';")
+    if MEMORY_LIMIT:
+        con.execute(f"set memory_limit = '{MEMORY_LIMIT}';")
+        # Insertion order is irrelevant for warehouse tables and forces
+        # extra buffering on large materializations.
+        con.execute("set preserve_insertion_order = false;")
+    if THREADS:
+        con.execute(f"set threads = {int(THREADS)};")
+
+
+def _run_sql_file(
+    con: duckdb.DuckDBPyConnection,
+    path: str,
+    memory_overrides: Dict[str, str],
+    thread_overrides: Dict[str, str],
+) -> None:
+    """I executed a SQL file statement by statement so each model could be governed."""
+    for model, stmt in _read_statements(path):
+        if model in memory_overrides:
+            con.execute(f"set memory_limit = '{memory_overrides[model]}';")
+        if model in thread_overrides:
+            con.execute(f"set threads = {int(thread_overrides[model])};")
+
+        try:
+            con.execute(stmt)
+        except (duckdb.OutOfMemoryException, duckdb.TransactionException) as exc:
+            if not _is_out_of_memory(exc):
+                raise
+            if _CREATE_INDEX.search(stmt):
+                # Indexes only speed up late-data lookups, which fall back to
+                # a scan without them, so I did not fail the build over one.
+                print(f"Skipped index on {model} after exceeding its memory budget")
+            elif model in BUCKETED_MODELS:
+                buckets = _build_bucketed(con, model, stmt)
+                print(f"Rebuilt {model} in {buckets} actor-hash buckets after exceeding its memory budget")
+            else:
+                raise
+        finally:
+            if model in memory_overrides:
+                if MEMORY_LIMIT:
+                    con.execute(f"set memory_limit = '{MEMORY_LIMIT}';")
+                else:
+                    con.execute("reset memory_limit;")
+            if model in thread_overrides:
+                if THREADS:
+                    con.execute(f"set threads = {int(THREADS)};")
+                else:
+                    con.execute("reset threads;")
+
 
 def main() -> None:
+    # I validated the overrides before loading anything, so a typo fails fast.
+    models = _sql_models()
+    memory_overrides = _parse_overrides(MODEL_MEMORY_LIMITS, models)
+    thread_overrides = _parse_overrides(MODEL_THREADS, models)
+
     os.makedirs("data/processed", exist_ok=True)
     con = duckdb.connect(DB_PATH)
+    _configure(con)
 
     con.execute("create schema if not exists bronze;")
     con.execute("create schema if not exists silver;")
@@ -49,18 +275,17 @@ def main() -> None:
 
     con.execute("drop table if exists bronze.raw_leads;")
     con.execute(
-        f"create table bronze.raw_leads as select * from read_parquet('{RAW_LEADS}');")
+        "create table bronze.raw_leads as select * from read_parquet(?, union_by_name = true);",
+        [_raw_files(RAW_LEADS)])
 
     con.execute("drop table if exists bronze.raw_purchases;")
     con.execute(
-        f"create table bronze.raw_purchases as select * from read_parquet('{RAW_PURCHASES}');")
+        "create table bronze.raw_purchases as select * from read_parquet(?, union_by_name = true);",
+        [_raw_files(RAW_PURCHASES)])
 
     # Materialized silver/gold tables using the versioned SQL definitions in pipelines/sql.
-    with open("pipelines/sql/models.sql", "r", encoding="utf-8") as f:
-        con.execute(f.read())
-
-    with open("pipelines/sql/kpis.sql", "r", encoding="utf-8") as f:
-        con.execute(f.read())
+    for path in SQL_FILES:
+        _run_sql_file(con, path, memory_overrides, thread_overrides)
 
     con.close()
     print(f"Built DuckDB warehouse at {DB_PATH}")
@@ -0,0 +1,491 @@
+"""
+I added streaming anomaly detection for the rates promised in
+docs/data_quality.md: approval rate, lead rate, and conversion rate, monitored
+per day x segment x credit band x campaign.
+
+Approval rate is dated by the decision. Lead rate and conversion rate follow
+the Eligibility -> Lead and Lead -> Purchase definitions in
+docs/kpi_definitions.md as cohort rates: leads are attributed to the decision
+day and purchases to the journey's lead day, within a fixed window, and a
+cohort day is scored once its window has closed.
+
+The detector runs after every load (build_warehouse.py via run_all.sh, and
+apply_late_data.py after each late batch commits). Each metric only reads
+days that closed since its previous run; a day is closed once every source
+of that metric has data past it, so lead and purchase loads close
+conversion-rate days without waiting for eligibility data.
+Per-slice baselines live in dq.rate_baselines as compact O(slices) state:
+- an EWMA of the rate and of its squared deviation
+- the last few same-weekday rates, whose median is the seasonal baseline
+
+New days are scored for all slices at once with numpy, then folded into the
+baselines. Alerts are appended to dq.anomalies.
+
+Every run that scores days keeps its baselines as a checkpoint, together
+with a fingerprint of the metric's source rows up to that day
+(dq.anomaly_checkpoints, NAV_ANOMALY_CHECKPOINT_DAYS of history). When late
+rows or a rebuild change silver, the next run rewinds to the newest
+checkpoint whose fingerprint still matches and re-scores from there, which
+covers exactly the cohorts the changed rows touch; their alerts are replaced.
+
+Campaign is only attributable for leads and purchases, so approval and lead
+rates are tracked with campaign_id = '(all)'.
+"""
+
+from __future__ import annotations
+
+import bisect
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+DB_PATH = os.environ.get("NAV_DB_PATH", "data/processed/navigator.duckdb")
+
+EWMA_ALPHA = float(os.environ.get("NAV_ANOMALY_ALPHA", 0.2))
+Z_THRESHOLD = float(os.environ.get("NAV_ANOMALY_Z", 4.0))
+WARMUP_DAYS = int(os.environ.get("NAV_ANOMALY_WARMUP_DAYS", 7))
+MIN_DENOMINATOR = int(os.environ.get("NAV_ANOMALY_MIN_DENOMINATOR", 30))
+SEASONAL_WEEKS = 4
+RESET_STATE = os.environ.get("NAV_ANOMALY_RESET", "0") == "1"
+
+# Checkpoints older than this are pruned. The default covers the 30-day
+# lateness horizon of apply_late_data.py with a few days to spare; older
+# changes re-score the metric from scratch.
+CHECKPOINT_DAYS = int(os.environ.get("NAV_ANOMALY_CHECKPOINT_DAYS", 35))
+
+SLICE_COLUMNS = ["metric", "segment", "credit_score_band", "campaign_id"]
+
+# Lead and conversion rates are cohort rates: the denominator is dated by the
+# earlier stage and the numerator counts later stages within a fixed window,
+# so a cohort day is only scored once its window has closed.
+LEAD_WINDOW_DAYS = int(os.environ.get("NAV_ANOMALY_LEAD_WINDOW_DAYS", 7))
+PURCHASE_WINDOW_DAYS = int(os.environ.get("NAV_ANOMALY_PURCHASE_WINDOW_DAYS", 15))
+
+SOURCE_TS = {
+    "silver.fact_eligibility_decision": "decision_ts",
+    "silver.fact_lead": "lead_ts",
+    "silver.fact_purchase": "purchase_ts",
+}
+
+_CUSTOMERS = """
+customers as (
+  select
+    customer_id,
+    coalesce(segment, '(unknown)') as segment,
+    coalesce(credit_score_band, '(unknown)') as credit_score_band
+  from silver.dim_customer
+)"""
+
+# Each query counts numerators and denominators per cohort day and slice for
+# cohort days in [$start, $end); $window is the metric's window in days.
+APPROVAL_SQL = f"""
+with {_CUSTOMERS}
+select
+  cast(e.decision_ts as date) as metric_date,
+  'approval_rate' as metric,
+  coalesce(c.segment, '(unknown)') as segment,
+  coalesce(c.credit_score_band, '(unknown)') as credit_score_band,
+  '(all)' as campaign_id,
+  count(*) filter (where e.approved_flag) as numerator,
+  count(*) as denominator
+from silver.fact_eligibility_decision e
+left join customers c on c.customer_id = e.customer_id
+where e.decision_ts >= $start and e.decision_ts < $end
+group by 1, 2, 3, 4, 5
+"""
+
+# Eligibility -> Lead: customers with a decision on the cohort day, converted
+# if they raised a lead within the lead window of their first decision.
+LEAD_RATE_SQL = f"""
+with {_CUSTOMERS},
+decision_cohort as (
+  select customer_id, min(decision_ts) as decision_ts
+  from silver.fact_eligibility_decision
+  where decision_ts >= $start and decision_ts < $end
+  group by customer_id, cast(decision_ts as date)
+),
+decision_outcomes as (
+  select d.customer_id, d.decision_ts, count(l.lead_id) > 0 as converted
+  from decision_cohort d
+  left join silver.fact_lead l
+    on l.customer_id = d.customer_id
+   and l.lead_ts >= d.decision_ts
+   and l.lead_ts < d.decision_ts + to_days($window)
+  group by 1, 2
+)
+select
+  cast(d.decision_ts as date) as metric_date,
+  'lead_rate' as metric,
+  coalesce(c.segment, '(unknown)') as segment,
+  coalesce(c.credit_score_band, '(unknown)') as credit_score_band,
+  '(all)' as campaign_id,
+  count(*) filter (where d.converted) as numerator,
+  count(*) as denominator
+from decision_outcomes d
+left join customers c on c.customer_id = d.customer_id
+group by 1, 2, 3, 4, 5
+"""
+
+# Lead -> Purchase (docs/kpi_definitions.md): journeys (customer x vehicle)
+# dated by their first lead, like gold.mart_funnel_journey, converted if the
+# first purchase lands within the purchase window.
+CONVERSION_RATE_SQL = f"""
+with {_CUSTOMERS},
+lead_cohort as (
+  select
+    customer_id,
+    vehicle_id,
+    min(lead_ts) as lead_ts,
+    arg_min(campaign_id, lead_ts) as campaign_id
+  from silver.fact_lead
+  group by 1, 2
+  having min(lead_ts) >= $start and min(lead_ts) < $end
+),
+first_purchase as (
+  select customer_id, vehicle_id, min(purchase_ts) as purchase_ts
+  from silver.fact_purchase
+  group by 1, 2
+)
+select
+  cast(j.lead_ts as date) as metric_date,
+  'conversion_rate' as metric,
+  coalesce(c.segment, '(unknown)') as segment,
+  coalesce(c.credit_score_band, '(unknown)') as credit_score_band,
+  coalesce(j.campaign_id, '(none)') as campaign_id,
+  count(*) filter (where p.purchase_ts < j.lead_ts + to_days($window)) as numerator,
+  count(*) as denominator
+from lead_cohort j
+left join first_purchase p on p.customer_id = j.customer_id and p.vehicle_id = j.vehicle_id
+left join customers c on c.customer_id = j.customer_id
+group by 1, 2, 3, 4, 5
+"""
+
+# Per metric: its counts query, the sources that close a day for it, and its
+# window (None when the metric has no cohort window).
+METRICS = {
+    "approval_rate": {
+        "sql": APPROVAL_SQL,
+        "sources": ["silver.fact_eligibility_decision"],
+        "window": None,
+    },
+    "lead_rate": {
+        "sql": LEAD_RATE_SQL,
+        "sources": ["silver.fact_eligibility_decision", "silver.fact_lead"],
+        "window": LEAD_WINDOW_DAYS,
+    },
+    "conversion_rate": {
+        "sql": CONVERSION_RATE_SQL,
+        "sources": ["silver.fact_lead", "silver.fact_purchase"],
+        "window": PURCHASE_WINDOW_DAYS,
+    },
+}
+
+
+def _ensure_tables(con: duckdb.DuckDBPyConnection) -> None:
+    con.execute("create schema if not exists dq;")
+    # Baselines from before checkpoints existed (a single dq.anomaly_watermark)
+    # cannot be rewound, so I dropped them once and re-scored from scratch.
+    legacy = con.execute("""
+        select count(*) from duckdb_tables()
+        where database_name = current_database()
+          and schema_name = 'dq' and table_name = 'anomaly_watermark'
+    """).fetchone()[0]
+    if RESET_STATE or legacy:
+        con.execute("drop table if exists dq.rate_baselines;")
+        con.execute("drop table if exists dq.anomaly_checkpoints;")
+        con.execute("drop table if exists dq.anomaly_watermark;")
+    con.execute("""
+        create table if not exists dq.rate_baselines (
+          as_of date,
+          metric varchar,
+          segment varchar,
+          credit_score_band varchar,
+          campaign_id varchar,
+          n_days integer,
+          ewma_rate double,
+          ewma_var double,
+          dow_history double[],
+          last_date date
+        );
+    """)
+    con.execute("""
+        create table if not exists dq.anomaly_checkpoints (
+          metric varchar,
+          as_of date,
+          source_fingerprint varchar
+        );
+    """)
+    con.execute("""
+        create table if not exists dq.anomalies (
+          detected_at timestamp,
+          metric_date date,
+          metric varchar,
+          segment varchar,
+          credit_score_band varchar,
+          campaign_id varchar,
+          numerator bigint,
+          denominator bigint,
+          rate double,
+          baseline double,
+          z_score double
+        );
+    """)
+
+
+def counts(con: duckdb.DuckDBPyConnection, metric: str, start: date, end: date) -> pd.DataFrame:
+    """I counted a metric's numerators and denominators for cohort days in [start, end)."""
+    spec = METRICS[metric]
+    params = {
+        "start": datetime.combine(start, datetime.min.time()),
+        "end": datetime.combine(end, datetime.min.time()),
+    }
+    if spec["window"] is not None:
+        params["window"] = spec["window"]
+    return con.execute(spec["sql"], params).fetchdf()
+
+
+def _source_fingerprints(con: duckdb.DuckDBPyConnection, sources: list) -> list:
+    """
+    I fingerprinted a metric's sources cumulatively by day: row count and sum
+    of row hashes up to and including each day. A row dated T only changes
+    cohorts scored once day T had closed, so a checkpoint stays valid while
+    the fingerprint at its as_of date is unchanged.
+    """
+    rows = " union all ".join(
+        f"select cast({SOURCE_TS[table]} as date) as day, hash(s) as h from {table} s"
+        for table in sources
+    )
+    return con.execute(f"""
+        select
+          day,
+          cast(sum(count(*)) over (order by day) as varchar)
+            || ':' || cast(sum(sum(h)) over (order by day) as varchar) as fingerprint
+        from ({rows})
+        group by day
+        order by day
+    """).fetchall()
+
+
+def _fingerprint_at(fingerprints: list, as_of: date) -> str:
+    i = bisect.bisect_right([day for day, _ in fingerprints], as_of)
+    return fingerprints[i - 1][1] if i else "0:0"
+
+
+def _closed_range(con: duckdb.DuckDBPyConnection, sources: list) -> tuple:
+    """I returned the first source day and the end (exclusive) of the closed days."""
+    bounds = [
+        con.execute(f"select min({SOURCE_TS[t]})::date, max({SOURCE_TS[t]})::date from {t}").fetchone()
+        for t in sources
+    ]
+    if any(last is None for _, last in bounds):
+        return None, None
+    return min(first for first, _ in bounds), min(last for _, last in bounds)
+
+
+def _load_state(con: duckdb.DuckDBPyConnection, metric: str, as_of: Optional[date]):
+    """I loaded a metric's baselines as of a checkpoint (none when as_of is None)."""
+    state = con.execute(
+        "select * exclude (as_of) from dq.rate_baselines where metric = ? and as_of = ?",
+        [metric, as_of],
+    ).fetchdf()
+    keys = {tuple(k): i for i, k in enumerate(state[SLICE_COLUMNS].itertuples(index=False))}
+    history = np.full((len(state), 7, SEASONAL_WEEKS), np.nan)
+    if len(state):
+        # Empty history slots are stored as NULL and come back masked.
+        rows = state["dow_history"].map(lambda h: np.ma.filled(np.ma.asarray(h, dtype=float), np.nan))
+        history[:] = np.stack(rows.to_list()).reshape(-1, 7, SEASONAL_WEEKS)
+    return state, keys, history
+
+
+def score_days(state: pd.DataFrame, keys: dict, history: np.ndarray, counts: pd.DataFrame):
+    """
+    I scored each new day against the current baselines (vectorized across
+    slices), then folded that day into the baselines before moving on.
+    Returns the updated state and a DataFrame of alerts.
+    """
+    # I copied the state columns: they are updated in place below, and under
+    # pandas copy-on-write to_numpy() returns read-only views.
+    n_days = state["n_days"].to_numpy(dtype=float, copy=True)
+    ewma = state["ewma_rate"].to_numpy(dtype=float, copy=True)
+    var = state["ewma_var"].to_numpy(dtype=float, copy=True)
+    last_date = state["last_date"].to_numpy(dtype=object, copy=True)
+    new_keys = list(state[SLICE_COLUMNS].itertuples(index=False, name=None))
+
+    alerts = []
+    for metric_date, day in counts.sort_values("metric_date").groupby("metric_date", sort=True):
+        # I registered slices seen for the first time with empty baselines.
+        for key in day[SLICE_COLUMNS].itertuples(index=False, name=None):
+            if key not in keys:
+                keys[key] = len(new_keys)
+                new_keys.append(key)
+        grow = len(new_keys) - len(n_days)
+        if grow:
+            n_days = np.concatenate([n_days, np.zeros(grow)])
+            ewma = np.concatenate([ewma, np.full(grow, np.nan)])
+            var = np.concatenate([var, np.zeros(grow)])
+            last_date = np.concatenate([last_date, np.full(grow, None, dtype=object)])
+            history = np.concatenate([history, np.full((grow, 7, SEASONAL_WEEKS), np.nan)])
+
+        idx = np.array([keys[k] for k in day[SLICE_COLUMNS].itertuples(index=False, name=None)])
+        num = day["numerator"].to_numpy(dtype=float)
+        den = day["denominator"].to_numpy(dtype=float)
+        valid = den > 0
+        idx, num, den = idx[valid], num[valid], den[valid]
+        rate = num / den
+        dow = pd.Timestamp(metric_date).dayofweek
+
+        # Seasonal median of the same weekday when available, else the EWMA.
+        same_dow = history[idx, dow, :]
+        seasonal_n = np.sum(~np.isnan(same_dow), axis=1)
+        with np.errstate(all="ignore"):
+            seasonal = np.nanmedian(np.where(seasonal_n[:, None] > 0, same_dow, 0.0), axis=1)
+        baseline = np.where(seasonal_n >= 2, seasonal, ewma[idx])
+
+        # Noise combines the slice's own day-to-day variance and binomial noise
+        # at today's denominator, so small slices do not alert on sampling noise.
+        # The binomial term uses the midpoint of baseline and observed rate,
+        # kept away from 0/1 so a zero baseline cannot produce unbounded z.
+        p = np.clip((np.nan_to_num(baseline) + rate) / 2, 1 / (den + 1), 1 - 1 / (den + 1))
+        sigma = np.sqrt(var[idx] + p * (1 - p) / den)
+        z = (rate - baseline) / np.maximum(sigma, 1e-9)
+
+        flagged = (n_days[idx] >= WARMUP_DAYS) & (den >= MIN_DENOMINATOR) & (np.abs(z) >= Z_THRESHOLD)
+        for j in np.flatnonzero(flagged):
+            metric, segment, band, campaign = new_keys[idx[j]]
+            alerts.append({
+                "metric_date": pd.Timestamp(metric_date).date(),
+                "metric": metric,
+                "segment": segment,
+                "credit_score_band": band,
+                "campaign_id": campaign,
+                "numerator": int(num[j]),
+                "denominator": int(den[j]),
+                "rate": float(rate[j]),
+                "baseline": float(baseline[j]),
+                "z_score": float(z[j]),
+            })
+
+        # I folded today's rate into the EWMA and the weekday history.
+        first = n_days[idx] == 0
+        diff = np.where(first, 0.0, rate - ewma[idx])
+        ewma[idx] = np.where(first, rate, ewma[idx] + EWMA_ALPHA * diff)
+        var[idx] = np.where(first, 0.0, (1 - EWMA_ALPHA) * (var[idx] + EWMA_ALPHA * diff ** 2))
+        history[idx, dow, 1:] = history[idx, dow, :-1]
+        history[idx, dow, 0] = rate
+        n_days[idx] += 1
+        last_date[idx] = pd.Timestamp(metric_date).date()
+
+    new_state = pd.DataFrame(new_keys, columns=SLICE_COLUMNS)
+    new_state["n_days"] = n_days.astype(int)
+    new_state["ewma_rate"] = ewma
+    new_state["ewma_var"] = var
+    new_state["dow_history"] = list(history.reshape(len(new_keys), -1))
+    new_state["last_date"] = last_date
+    return new_state, pd.DataFrame(alerts)
+
+
+def _run_metric(con: duckdb.DuckDBPyConnection, metric: str, detected_at: datetime) -> dict:
+    """
+    I rewound a metric to its newest checkpoint that still matches silver,
+    scored every cohort day that closed since, and saved a new checkpoint.
+    """
+    spec = METRICS[metric]
+    window = timedelta(days=spec["window"] or 0)
+    fingerprints = _source_fingerprints(con, spec["sources"])
+
+    checkpoints = con.execute(
+        "select as_of, source_fingerprint from dq.anomaly_checkpoints where metric = ? order by as_of desc",
+        [metric],
+    ).fetchall()
+    restore = next(
+        (as_of for as_of, fingerprint in checkpoints if _fingerprint_at(fingerprints, as_of) == fingerprint),
+        None,
+    )
+    latest = checkpoints[0][0] if checkpoints else None
+
+    first_day, closed_end = _closed_range(con, spec["sources"])
+    start = restore + timedelta(days=1) if restore else first_day
+    if start is None:
+        return {"days_scored": 0, "rescored_from": None, "anomalies": 0}
+    end = max(closed_end or start, start)
+    rescored_from = start if restore != latest else None
+    if end == start and rescored_from is None:
+        return {"days_scored": 0, "rescored_from": None, "anomalies": 0}
+
+    state, keys, history = _load_state(con, metric, restore)
+    new_state, alerts = score_days(state, keys, history, counts(con, metric, start - window, end - window))
+
+    as_of = end - timedelta(days=1)
+    con.execute("begin transaction;")
+    try:
+        # Checkpoints past the restore point describe silver as it was before
+        # the change, and their cohorts are re-scored below.
+        for table in ["dq.rate_baselines", "dq.anomaly_checkpoints"]:
+            con.execute(
+                f"delete from {table} where metric = ? and (? is null or as_of > ?);",
+                [metric, restore, restore],
+            )
+        con.execute(
+            "delete from dq.anomalies where metric = ? and metric_date >= ?;", [metric, start - window])
+        if end > start:
+            new_state.insert(0, "as_of", as_of)
+            con.register("new_state", new_state)
+            con.execute("insert into dq.rate_baselines by name select * from new_state;")
+            con.unregister("new_state")
+            con.execute(
+                "insert into dq.anomaly_checkpoints values (?, ?, ?);",
+                [metric, as_of, _fingerprint_at(fingerprints, as_of)],
+            )
+            for table in ["dq.rate_baselines", "dq.anomaly_checkpoints"]:
+                con.execute(
+                    f"delete from {table} where metric = ? and as_of < ?;",
+                    [metric, as_of - timedelta(days=CHECKPOINT_DAYS)],
+                )
+        if len(alerts):
+            alerts.insert(0, "detected_at", detected_at)
+            con.register("new_alerts", alerts)
+            con.execute("insert into dq.anomalies by name select * from new_alerts;")
+            con.unregister("new_alerts")
+        con.execute("commit;")
+    except Exception:
+        con.execute("rollback;")
+        raise
+
+    return {"days_scored": (end - start).days, "rescored_from": rescored_from, "anomalies": len(alerts)}
+
+
+def run(con: duckdb.DuckDBPyConnection) -> dict:
+    """I scored every newly closed (or changed) day per metric and persisted alerts and baselines."""
+    _ensure_tables(con)
+    detected_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    metrics = {metric: _run_metric(con, metric, detected_at) for metric in METRICS}
+    return {
+        "days_scored": {metric: r["days_scored"] for metric, r in metrics.items()},
+        "rescored_from": {metric: r["rescored_from"] for metric, r in metrics.items() if r["rescored_from"]},
+        "anomalies": sum(r["anomalies"] for r in metrics.values()),
+    }
+
+
+def describe(summary: dict) -> str:
+    """I summarized a run in one line for the pipeline logs."""
+    scored = ", ".join(f"{metric} {days}" for metric, days in summary["days_scored"].items())
+    rescored = "".join(
+        f"; re-scored {metric} from {day} after its sources changed"
+        for metric, day in summary["rescored_from"].items()
+    )
+    return f"Scored day(s): {scored}{rescored}; wrote {summary['anomalies']} anomalies to dq.anomalies"
+
+
+def main() -> None:
+    con = duckdb.connect(DB_PATH)
+    summary = run(con)
+    con.close()
+    print(describe(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+I exported the gold layer for BI extracts (see docs/tableau_public.md).
+
+Instead of full CSV dumps, I wrote:
+- gold.mart_funnel_journey as hive-partitioned, ZSTD-compressed parquet
+  (event_date=YYYY-MM-DD/variant=...), where event_date is the browse date
+- the KPI views as small parquet snapshots, hive-partitioned by variant where
+  the view has one (vw_funnel_kpis is a single overall row)
+- gold.agg_funnel_daily as a flat, pre-aggregated extract (parquet + CSV)
+  that Tableau / Hyper can ingest directly
+
+Each mart partition is fingerprinted in DuckDB, so repeat exports only
+rewrite partitions that changed (in a single partitioned COPY). A manifest
+records the fingerprints, the directory DuckDB wrote each partition to
+(NULL variants land in variant=__HIVE_DEFAULT_PARTITION__ and other values
+may be percent-escaped), and a sha256 checksum per exported file.
+
+Setting NAV_EXPORT_BENCHMARK=1 also timed a full parquet export against a
+full CSV dump and wrote the comparison to outputs/export_benchmark.json.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict
+
+import duckdb
+
+DB_PATH = os.environ.get("NAV_DB_PATH", "data/processed/navigator.duckdb")
+EXPORT_DIR = os.environ.get("NAV_EXPORT_DIR", "data/exports/gold")
+RUN_BENCHMARK = os.environ.get("NAV_EXPORT_BENCHMARK", "0") == "1"
+
+MART = "gold.mart_funnel_journey"
+MART_DIR = "mart_funnel_journey"
+# KPI views and their hive partition columns; vw_funnel_kpis is one overall
+# row, so it has nothing to partition on.
+KPI_VIEWS = {
+    "gold.vw_funnel_kpis": [],
+    "gold.vw_experiment_readout": ["variant"],
+}
+EXTRACT_TABLE = "gold.agg_funnel_daily"
+
+MANIFEST_NAME = "manifest.json"
+PARQUET_OPTIONS = "(format parquet, compression zstd)"
+
+# I derived the extract's rates from additive counts so it stays consistent
+# with whatever the mart holds at export time.
+EXTRACT_SQL = f"""
+select
+  event_date,
+  experiment_id,
+  variant,
+  journeys,
+  eligibility_journeys,
+  lead_journeys,
+  purchase_journeys,
+  eligibility_journeys::double / nullif(journeys, 0) as browse_to_eligibility_rate,
+  lead_journeys::double / nullif(journeys, 0) as browse_to_lead_rate,
+  purchase_journeys::double / nullif(journeys, 0) as browse_to_purchase_rate,
+  eligible_lead_journeys::double / nullif(eligibility_journeys, 0) as eligibility_to_lead_rate,
+  lead_purchase_journeys::double / nullif(lead_journeys, 0) as lead_to_purchase_rate,
+  sum_mins_to_eligibility::double / nullif(eligibility_journeys, 0) as avg_minutes_to_eligibility,
+  sum_mins_to_purchase::double / nullif(purchase_journeys, 0) as avg_minutes_to_purchase
+from {EXTRACT_TABLE}
+order by event_date, variant
+"""
+
+
+def _sql_literal(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def _load_manifest(export_dir: str) -> dict:
+    path = os.path.join(export_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"partitions": {}, "files": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _copy(con: duckdb.DuckDBPyConnection, query: str, path: str, options: str) -> None:
+    """I wrote to a temporary file first so a failed export never leaves a torn file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    con.execute(f"copy ({query}) to {_sql_literal(tmp_path)} {options};")
+    os.replace(tmp_path, path)
+
+
+def _copy_partitioned(con: duckdb.DuckDBPyConnection, query: str, path: str, columns: list) -> None:
+    """I wrote a hive-partitioned directory next to the old one, then swapped it in."""
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    con.execute(f"""
+        copy ({query}) to {_sql_literal(tmp_path)}
+        (format parquet, compression zstd, partition_by ({', '.join(columns)}), filename_pattern 'data_{{i}}');
+    """)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+
+def _record_files(files: Dict[str, str], export_dir: str, rel_dir: str) -> None:
+    """I replaced the manifest entries under rel_dir with checksums of what is on disk now."""
+    for rel_path in [f for f in files if f.startswith(rel_dir + "/")]:
+        files.pop(rel_path)
+    for root, _, names in os.walk(os.path.join(export_dir, rel_dir)):
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            files[os.path.relpath(path, export_dir)] = _sha256(path)
+
+
+def _partition_key(event_date, variant) -> str:
+    """I keyed partitions by their values, which stay stable however DuckDB names the directory."""
+    return json.dumps([str(event_date), variant])
+
+
+def _staged_partitions(con: duckdb.DuckDBPyConnection, staging_dir: str) -> Dict[str, str]:
+    """
+    I read the staged partition directories back through DuckDB's own hive
+    decoding and mapped each partition key to the directory it was written to.
+    """
+    rows = con.execute("""
+        select event_date, variant, filename
+        from read_parquet(
+          ?,
+          hive_partitioning = true,
+          hive_types = {'event_date': date, 'variant': varchar},
+          filename = true
+        )
+        group by all
+    """, [os.path.join(staging_dir, MART_DIR, "**", "*.parquet")]).fetchall()
+    return {
+        _partition_key(event_date, variant): os.path.relpath(os.path.dirname(filename), staging_dir)
+        for event_date, variant, filename in rows
+    }
+
+
+def _partition_fingerprints(con: duckdb.DuckDBPyConnection) -> Dict[str, dict]:
+    """
+    I fingerprinted every (event_date, variant) partition with a row count and
+    an order-independent sum of row hashes, computed in a single scan.
+    """
+    rows = con.execute(f"""
+        select
+          cast(first_browse_ts as date) as event_date,
+          variant,
+          count(*) as n_rows,
+          cast(sum(hash(m)) as varchar) as fingerprint
+        from {MART} m
+        group by 1, 2
+    """).fetchall()
+
+    partitions = {}
+    for event_date, variant, n_rows, fingerprint in rows:
+        partitions[_partition_key(event_date, variant)] = {
+            "event_date": str(event_date),
+            "variant": variant,
+            "rows": int(n_rows),
+            "fingerprint": fingerprint,
+        }
+    return partitions
+
+
+def export_gold(con: duckdb.DuckDBPyConnection, export_dir: str, force: bool = False) -> dict:
+    """
+    I exported the gold marts, KPI views, and BI extract into export_dir and
+    returned a small summary of what was (re)written.
+    """
+    os.makedirs(export_dir, exist_ok=True)
+    previous = {} if force else _load_manifest(export_dir)
+    previous_partitions = previous.get("partitions", {})
+    files = dict(previous.get("files", {}))
+
+    partitions = _partition_fingerprints(con)
+    changed = []
+    for key, part in partitions.items():
+        old = previous_partitions.get(key, {})
+        if old.get("fingerprint") == part["fingerprint"] and "path" in old:
+            part["path"] = old["path"]
+        else:
+            changed.append(key)
+
+    # I removed partitions that no longer exist in the mart (and the old copies
+    # of changed ones) before writing, so a removal never touches fresh output.
+    removed = 0
+    for key, old in previous_partitions.items():
+        if key in partitions and key not in changed:
+            continue
+        if "path" in old:
+            shutil.rmtree(os.path.join(export_dir, old["path"]), ignore_errors=True)
+            _record_files(files, export_dir, old["path"])
+        if key not in partitions:
+            removed += 1
+
+    if changed:
+        # I wrote all changed partitions in a single partitioned COPY into a
+        # staging directory, then swapped each partition directory into place.
+        staging_dir = os.path.join(export_dir, ".staging")
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        os.makedirs(staging_dir)
+        keys_sql = ", ".join(
+            f"(date {_sql_literal(partitions[key]['event_date'])}, "
+            f"{'null' if partitions[key]['variant'] is None else _sql_literal(partitions[key]['variant'])})"
+            for key in changed
+        )
+        con.execute(f"""
+            copy (
+              select m.*, cast(m.first_browse_ts as date) as event_date
+              from {MART} m
+              join (values {keys_sql}) as k(event_date, variant)
+                on k.event_date = cast(m.first_browse_ts as date)
+               and k.variant is not distinct from m.variant
+            ) to {_sql_literal(os.path.join(staging_dir, MART_DIR))}
+            (format parquet, compression zstd, partition_by (event_date, variant), filename_pattern 'data_{{i}}');
+        """)
+
+        staged = _staged_partitions(con, staging_dir)
+        for key in changed:
+            path = staged[key]
+            partitions[key]["path"] = path
+            target = os.path.join(export_dir, path)
+            shutil.rmtree(target, ignore_errors=True)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(os.path.join(staging_dir, path), target)
+            _record_files(files, export_dir, path)
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    # The KPI views and extract are tiny, so I re-exported them on every run.
+    for view, partition_columns in KPI_VIEWS.items():
+        name = view.split(".")[-1]
+        if partition_columns:
+            rel_dir = f"kpis/{name}"
+            _copy_partitioned(con, f"select * from {view}", os.path.join(export_dir, rel_dir), partition_columns)
+            _record_files(files, export_dir, rel_dir)
+        else:
+            rel_path = f"kpis/{name}.parquet"
+            _copy(con, f"select * from {view}", os.path.join(export_dir, rel_path), PARQUET_OPTIONS)
+            files[rel_path] = _sha256(os.path.join(export_dir, rel_path))
+
+    for rel_path, options in [
+        ("extract/funnel_daily.parquet", PARQUET_OPTIONS),
+        ("extract/funnel_daily.csv", "(format csv, header true)"),
+    ]:
+        _copy(con, EXTRACT_SQL, os.path.join(export_dir, rel_path), options)
+        files[rel_path] = _sha256(os.path.join(export_dir, rel_path))
+
+    manifest = {
+        "exported_at": datetime.now(timezone.utc).isoformat(),
+        "source": MART,
+        "partition_columns": ["event_date", "variant"],
+        "partitions": partitions,
+        "files": files,
+    }
+    with open(os.path.join(export_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return {
+        "partitions_total": len(partitions),
+        "partitions_written": len(changed),
+        "partitions_removed": removed,
+    }
+
+
+def benchmark_export(con: duckdb.DuckDBPyConnection) -> dict:
+    """I timed a cold parquet export against the full CSV dump it replaced."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, "mart_funnel_journey.csv")
+        start = time.perf_counter()
+        con.execute(f"copy {MART} to {_sql_literal(csv_path)} (format csv, header true);")
+        csv_seconds = time.perf_counter() - start
+        csv_bytes = os.path.getsize(csv_path)
+
+        parquet_dir = os.path.join(tmp_dir, "parquet")
+        start = time.perf_counter()
+        export_gold(con, parquet_dir, force=True)
+        parquet_seconds = time.perf_counter() - start
+        parquet_bytes = _dir_size(os.path.join(parquet_dir, MART_DIR))
+
+        start = time.perf_counter()
+        export_gold(con, parquet_dir)
+        incremental_seconds = time.perf_counter() - start
+
+    return {
+        "rows": int(con.execute(f"select count(*) from {MART}").fetchone()[0]),
+        "csv_seconds": round(csv_seconds, 3),
+        "csv_bytes": csv_bytes,
+        "parquet_seconds": round(parquet_seconds, 3),
+        "parquet_bytes": parquet_bytes,
+        "parquet_incremental_noop_seconds": round(incremental_seconds, 3),
+        "size_ratio_csv_to_parquet": round(csv_bytes / max(parquet_bytes, 1), 2),
+    }
+
+
+def main() -> None:
+    con = duckdb.connect(DB_PATH, read_only=True)
+
+    summary = export_gold(con, EXPORT_DIR)
+    print(
+        f"Exported gold layer to {EXPORT_DIR} "
+        f"({summary['partitions_written']}/{summary['partitions_total']} partitions rewritten, "
+        f"{summary['partitions_removed']} removed)"
+    )
+
+    if RUN_BENCHMARK:
+        result = benchmark_export(con)
+        os.makedirs("outputs", exist_ok=True)
+        with open("outputs/export_benchmark.json", "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print("Wrote export benchmark to outputs/export_benchmark.json")
+
+    con.close()
+
+
+if __name__ == "__main__":
+    main()
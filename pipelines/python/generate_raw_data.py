@@ -18,6 +18,7 @@ from __future__ import annotations
 import json
 import os
 import random
+import shutil
 from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Tuple
 
@@ -507,6 +508,8 @@ def main() -> None:
         seed=seed,
     )
 
+    # Late batches landed for a previous dataset would not match this one.
+    shutil.rmtree("data/raw/late", ignore_errors=True)
     _write_parquet(customers, "data/raw/raw_customers.parquet")
     _write_parquet(vehicles, "data/raw/raw_vehicles.parquet")
     _write_parquet(events, "data/raw/raw_events.parquet")
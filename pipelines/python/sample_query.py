@@ -0,0 +1,275 @@
+"""
+I added a sampled query mode for interactive exploration of the funnel.
+
+The warehouse build maintains deterministic actor-hash samples
+(pipelines/sql/samples.sql). This helper routes exploratory KPI queries to
+the 1% or 10% sample of gold.mart_funnel_journey and returns estimates with
+error bars; passing full=True falls back to the full mart for exact values.
+
+Estimates are stratified by variant: each stratum is re-weighted by its
+population / sample actor counts, and standard errors use a linearized
+ratio estimator with actors as clusters (one actor's journeys are sampled
+together, so they are not treated as independent).
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from typing import Optional, Sequence
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+DB_PATH = os.environ.get("NAV_DB_PATH", "data/processed/navigator.duckdb")
+SAMPLE_PCT = int(os.environ.get("NAV_SAMPLE_PCT", 1))
+
+MART = "gold.mart_funnel_journey"
+MART_SAMPLE = "gold.mart_funnel_journey_sample"
+SAMPLE_TABLES = {
+    "silver.fact_events": "silver.fact_events_sample",
+    MART: MART_SAMPLE,
+}
+SAMPLE_SIZE_COLUMNS = {1: "sample_actors_1pct", 10: "sample_actors_10pct"}
+
+# Below this many sampled successes (or failures) the linearized variance is
+# not trustworthy (it collapses to 0 when a slice has no events), so I
+# flagged the estimate and fell back to a Wilson score interval.
+MIN_SAMPLED_EVENTS = int(os.environ.get("NAV_SAMPLE_MIN_EVENTS", 10))
+
+# Each KPI is a ratio of journey-level numerator and denominator expressions.
+RATE_METRICS = {
+    "browse_to_eligibility_rate": ("reached_eligibility", "1"),
+    "browse_to_lead_rate": ("reached_lead", "1"),
+    "browse_to_purchase_rate": ("reached_purchase", "1"),
+    "eligibility_to_lead_rate": ("reached_eligibility * reached_lead", "reached_eligibility"),
+    "lead_to_purchase_rate": ("reached_lead * reached_purchase", "reached_lead"),
+}
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def sampled(table: str, sample_pct: int = SAMPLE_PCT) -> str:
+    """I returned a SQL relation over the deterministic sample of a table, for ad-hoc queries."""
+    if table not in SAMPLE_TABLES:
+        raise ValueError(f"No sample is maintained for {table}")
+    if sample_pct not in SAMPLE_SIZE_COLUMNS:
+        raise ValueError(f"sample_pct must be one of {sorted(SAMPLE_SIZE_COLUMNS)}")
+    return f"(select * from {SAMPLE_TABLES[table]} where sample_bucket < {sample_pct})"
+
+
+def _group_columns(group_by: Sequence[str]) -> list:
+    columns = list(group_by)
+    for col in columns:
+        if not _IDENTIFIER.match(col):
+            raise ValueError(f"Invalid group_by column: {col!r}")
+    return columns
+
+
+def _exact_kpis(con: duckdb.DuckDBPyConnection, group_cols: list, where: Optional[str]) -> pd.DataFrame:
+    """I computed exact KPIs on the full mart using the same ratio definitions."""
+    select_groups = "".join(f"{col}, " for col in group_cols)
+    group_clause = f"group by {', '.join(group_cols)}" if group_cols else ""
+    sums = ",\n".join(
+        f"sum({num})::double as {name}__y, sum({den})::double as {name}__x"
+        for name, (num, den) in RATE_METRICS.items()
+    )
+    df = con.execute(f"""
+        select {select_groups}count(*)::double as total_journeys, {sums}
+        from {MART}
+        where {where or 'true'}
+        {group_clause}
+    """).fetchdf()
+
+    rows = []
+    for _, r in df.iterrows():
+        base = {col: r[col] for col in group_cols}
+        rows.append({
+            **base,
+            "metric": "total_journeys",
+            "estimate": r["total_journeys"],
+            "std_error": 0.0,
+            "numerator_count": r["total_journeys"],
+            "denominator_count": np.nan,
+        })
+        for name in RATE_METRICS:
+            x = r[f"{name}__x"]
+            rows.append({
+                **base,
+                "metric": name,
+                "estimate": r[f"{name}__y"] / x if x else np.nan,
+                "std_error": 0.0,
+                "numerator_count": r[f"{name}__y"],
+                "denominator_count": x,
+            })
+    return pd.DataFrame(rows)
+
+
+def _sampled_kpis(con: duckdb.DuckDBPyConnection, group_cols: list, where: Optional[str],
+                  sample_pct: int) -> pd.DataFrame:
+    """
+    I aggregated the sample to per-actor totals, then to per-(group, stratum)
+    moments, so only O(groups x strata) rows leave DuckDB.
+    """
+    if sample_pct not in SAMPLE_SIZE_COLUMNS:
+        raise ValueError(f"sample_pct must be one of {sorted(SAMPLE_SIZE_COLUMNS)}")
+
+    actor_groups = ", ".join(["variant"] + [c for c in group_cols if c != "variant"])
+    actor_sums = ",\n".join(
+        f"sum({num})::double as {name}__y, sum({den})::double as {name}__x"
+        for name, (num, den) in RATE_METRICS.items()
+    )
+    moments = ",\n".join(
+        f"sum({name}__y) as {name}__sy, sum({name}__x) as {name}__sx, "
+        f"sum({name}__y * {name}__y) as {name}__syy, sum({name}__x * {name}__x) as {name}__sxx, "
+        f"sum({name}__y * {name}__x) as {name}__sxy"
+        for name in RATE_METRICS
+    )
+    df = con.execute(f"""
+        with actors as (
+          select
+            {actor_groups},
+            coalesce(customer_id, anonymous_id) as actor_id,
+            count(*)::double as journeys,
+            {actor_sums}
+          from {MART_SAMPLE}
+          where sample_bucket < {sample_pct}
+            and ({where or 'true'})
+          group by all
+        )
+        select
+          {actor_groups},
+          sum(journeys) as journeys__sx,
+          sum(journeys * journeys) as journeys__sxx,
+          {moments}
+        from actors
+        group by all
+    """).fetchdf()
+
+    strata = con.execute(
+        f"select variant, population_actors::double as big_n, "
+        f"{SAMPLE_SIZE_COLUMNS[sample_pct]}::double as n from gold.sample_strata"
+    ).fetchdf()
+    df = df.merge(strata, on="variant", how="left")
+
+    # Per-stratum weights, finite population correction, and variance scale.
+    # Actors outside a group count as zeros in its domain, so the variance
+    # uses the full stratum sample size n.
+    w = df["big_n"] / df["n"]
+    var_scale = df["big_n"] ** 2 * (1.0 - df["n"] / df["big_n"]) / df["n"]
+    dof = (df["n"] - 1).clip(lower=1)
+
+    groups = df.groupby(group_cols, dropna=False) if group_cols else [((), df)]
+    rows = []
+    for key, g in groups:
+        key = key if isinstance(key, tuple) else (key,)
+        base = dict(zip(group_cols, key))
+        idx = g.index
+        gw, gvar_scale, gdof, gn = w.loc[idx], var_scale.loc[idx], dof.loc[idx], df.loc[idx, "n"]
+
+        total = (gw * g["journeys__sx"]).sum()
+        total_var = (gvar_scale * (g["journeys__sxx"] - g["journeys__sx"] ** 2 / gn) / gdof).sum()
+        rows.append({
+            **base,
+            "metric": "total_journeys",
+            "estimate": total,
+            "std_error": np.sqrt(total_var),
+            "numerator_count": g["journeys__sx"].sum(),
+            "denominator_count": np.nan,
+        })
+
+        for name in RATE_METRICS:
+            sy, sx = g[f"{name}__sy"], g[f"{name}__sx"]
+            y_hat, x_hat = (gw * sy).sum(), (gw * sx).sum()
+            # Effective sample size treats each actor's journeys as one fully
+            # correlated cluster, (sum x)^2 / sum x^2, so fallback intervals
+            # are not narrowed by heavy actors.
+            sxx = g[f"{name}__sxx"].sum()
+            counts = {
+                "numerator_count": sy.sum(),
+                "denominator_count": sx.sum(),
+                "effective_n": sx.sum() ** 2 / sxx if sxx else 0.0,
+            }
+            if x_hat == 0:
+                rows.append({**base, "metric": name, "estimate": np.nan, "std_error": np.nan, **counts})
+                continue
+            r = y_hat / x_hat
+            szz = g[f"{name}__syy"] - 2 * r * g[f"{name}__sxy"] + r ** 2 * g[f"{name}__sxx"]
+            sz = sy - r * sx
+            var_r = (gvar_scale * (szz - sz ** 2 / gn) / gdof).sum() / x_hat ** 2
+            rows.append({**base, "metric": name, "estimate": r, "std_error": np.sqrt(max(var_r, 0.0)), **counts})
+    return pd.DataFrame(rows)
+
+
+def _wilson_interval(successes: pd.Series, trials: pd.Series, effective_n: pd.Series, z: float):
+    """I used the Wilson score interval, which stays wide when there are few or no events."""
+    n = trials.where(trials > 0)
+    p = successes / n
+    n = effective_n.where(effective_n > 0)
+    denom = 1 + z ** 2 / n
+    center = (p + z ** 2 / (2 * n)) / denom
+    half = z * np.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / denom
+    return center - half, center + half
+
+
+def estimate_kpis(
+    con: duckdb.DuckDBPyConnection,
+    group_by: Sequence[str] = ("variant",),
+    sample_pct: int = SAMPLE_PCT,
+    full: bool = False,
+    where: Optional[str] = None,
+    z: float = 1.96,
+) -> pd.DataFrame:
+    """
+    I estimated funnel KPIs from the actor sample (or exactly, with full=True)
+    and returned one row per group and metric with a confidence interval.
+
+    Sampled estimates backed by fewer than MIN_SAMPLED_EVENTS successes or
+    failures are returned with reliable=False, std_error=NaN, and a Wilson
+    interval on the sampled counts instead of a (possibly zero-width)
+    linearized one.
+    """
+    group_cols = _group_columns(group_by)
+    if full:
+        df = _exact_kpis(con, group_cols, where)
+    else:
+        df = _sampled_kpis(con, group_cols, where, sample_pct)
+
+    df["ci_low"] = df["estimate"] - z * df["std_error"]
+    df["ci_high"] = df["estimate"] + z * df["std_error"]
+
+    if full:
+        df["reliable"] = True
+    else:
+        is_rate = df["metric"] != "total_journeys"
+        successes = df["numerator_count"]
+        failures = (df["denominator_count"] - df["numerator_count"]).where(is_rate, np.inf)
+        df["reliable"] = (successes >= MIN_SAMPLED_EVENTS) & (failures >= MIN_SAMPLED_EVENTS)
+
+        fallback = ~df["reliable"]
+        wilson_low, wilson_high = _wilson_interval(
+            df["numerator_count"], df["denominator_count"], df["effective_n"], z)
+        df.loc[fallback, "std_error"] = np.nan
+        df.loc[fallback & is_rate, "ci_low"] = wilson_low[fallback & is_rate]
+        df.loc[fallback & is_rate, "ci_high"] = wilson_high[fallback & is_rate]
+        df.loc[fallback & ~is_rate, ["ci_low", "ci_high"]] = np.nan
+
+    df["sample_pct"] = 100 if full else sample_pct
+    return df
+
+
+def main() -> None:
+    con = duckdb.connect(DB_PATH, read_only=True)
+    sampled_df = estimate_kpis(con, sample_pct=SAMPLE_PCT)
+    full_df = estimate_kpis(con, full=True)
+    con.close()
+
+    os.makedirs("outputs", exist_ok=True)
+    pd.concat([sampled_df, full_df], ignore_index=True).to_csv(
+        "outputs/sample_kpis.csv", index=False)
+    print("Wrote sampled vs full KPI estimates to outputs/sample_kpis.csv")
+
+
+if __name__ == "__main__":
+    main()
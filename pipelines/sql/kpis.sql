@@ -39,3 +39,25 @@ select
 from gold.mart_funnel_journey
 where experiment_id is not null
 group by 1, 2;
+
+
+-- I pre-aggregated the mart to one row per browse day and variant so BI
+-- extracts (Tableau) stay small. Every measure is an additive count or sum,
+-- so rates and averages are derived downstream and the table can be rolled up.
+
+drop table if exists gold.agg_funnel_daily;
+create table gold.agg_funnel_daily as
+select
+  cast(first_browse_ts as date) as event_date,
+  experiment_id,
+  variant,
+  count(*)::bigint as journeys,
+  sum(reached_eligibility)::bigint as eligibility_journeys,
+  sum(reached_lead)::bigint as lead_journeys,
+  sum(reached_purchase)::bigint as purchase_journeys,
+  sum(case when reached_eligibility = 1 then reached_lead else 0 end)::bigint as eligible_lead_journeys,
+  sum(case when reached_lead = 1 then reached_purchase else 0 end)::bigint as lead_purchase_journeys,
+  sum(mins_to_eligibility)::bigint as sum_mins_to_eligibility,
+  sum(mins_to_purchase)::bigint as sum_mins_to_purchase
+from gold.mart_funnel_journey
+group by 1, 2, 3;
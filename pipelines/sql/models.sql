@@ -173,3 +173,11 @@ from browse b
 left join elig e on e.customer_id = b.customer_id
 left join lead l on l.customer_id = b.customer_id and l.vehicle_id = b.vehicle_id
 left join purchase p on p.customer_id = b.customer_id and p.vehicle_id = b.vehicle_id;
+
+
+-- I indexed journeys by customer_id so late-arriving leads and purchases can
+-- find their journeys with point lookups. DuckDB only probes single-column
+-- ART indexes for = / IN filters, so vehicle_id is matched after the probe.
+
+create index idx_mart_funnel_journey_customer
+  on gold.mart_funnel_journey (customer_id);
@@ -0,0 +1,44 @@
+-- I maintained deterministic actor-level samples for interactive exploration.
+-- Actors are sampled by hash of coalesce(customer_id, anonymous_id), so whole
+-- journeys stay intact and funnel rates are not biased by partial journeys.
+-- sample_bucket is in [0, 100): the 10% sample is sample_bucket < 10 and the
+-- nested 1% sample is sample_bucket < 1.
+
+drop table if exists silver.fact_events_sample;
+create table silver.fact_events_sample as
+select
+  *,
+  hash(coalesce(customer_id, anonymous_id)) % 100 as sample_bucket
+from silver.fact_events
+where hash(coalesce(customer_id, anonymous_id)) % 100 < 10;
+
+
+drop table if exists gold.mart_funnel_journey_sample;
+create table gold.mart_funnel_journey_sample as
+select
+  *,
+  hash(coalesce(customer_id, anonymous_id)) % 100 as sample_bucket
+from gold.mart_funnel_journey
+where hash(coalesce(customer_id, anonymous_id)) % 100 < 10;
+
+
+-- I recorded population and sample sizes per variant (the stratum) so
+-- sampled queries can be re-weighted into unbiased estimates with error bars.
+
+drop table if exists gold.sample_strata;
+create table gold.sample_strata as
+with actors as (
+  select
+    variant,
+    coalesce(customer_id, anonymous_id) as actor_id,
+    hash(coalesce(customer_id, anonymous_id)) % 100 as sample_bucket
+  from gold.mart_funnel_journey
+  group by 1, 2, 3
+)
+select
+  variant,
+  count(*) as population_actors,
+  count(*) filter (where sample_bucket < 1) as sample_actors_1pct,
+  count(*) filter (where sample_bucket < 10) as sample_actors_10pct
+from actors
+group by 1;
@@ -10,15 +10,23 @@ python pipelines/python/generate_raw_data.py
 # I built the DuckDB warehouse and materialized silver/gold tables.
 python pipelines/python/build_warehouse.py
 
+# I scored newly loaded days for approval / lead / conversion rate anomalies.
+python pipelines/python/detect_anomalies.py
+
 # I ran baseline data quality checks before consuming analytics outputs.
 python pipelines/python/run_dq_checks.py
 
 # I produced an A/B experiment readout for personalization effectiveness.
 python pipelines/python/experiment_readout.py
 
+# I exported the gold layer as partitioned parquet plus a BI extract for Tableau.
+python pipelines/python/export_gold.py
+
 echo
 echo "Pipeline completed successfully."
 echo "Key outputs:"
 echo "- DuckDB warehouse: data/processed/navigator.duckdb"
 echo "- Data quality report: outputs/dq_report.json"
+echo "- Rate anomalies: dq.anomalies (in the DuckDB warehouse)"
 echo "- Experiment readout: outputs/experiment_readout.csv"
+echo "- Gold export for BI: data/exports/gold/"
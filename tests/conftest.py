@@ -0,0 +1,53 @@
+"""
+I shared one tiny generated raw dataset across the pipeline tests, and a
+helper that runs a pipeline script against it the way run_all.sh does.
+"""
+
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+PYTHON_DIR = REPO_ROOT / "pipelines" / "python"
+
+sys.path.insert(0, str(PYTHON_DIR))
+
+# Small enough to keep the tests quick, large enough that the mart needs
+# more than a few MB when built in one pass.
+TINY_DATASET = {
+    "NAV_CUSTOMERS": "3000",
+    "NAV_VEHICLES": "2000",
+    "NAV_EVENT_TARGET": "30000",
+}
+
+
+def _run(script: str, cwd: Path, **env: str) -> str:
+    result = subprocess.run(
+        [sys.executable, str(PYTHON_DIR / script)],
+        cwd=cwd,
+        env={**os.environ, **env},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout
+
+
+@pytest.fixture(scope="session")
+def run_script():
+    """I ran a pipeline script from a working directory with extra NAV_* settings."""
+    return _run
+
+
+@pytest.fixture(scope="session")
+def workdir(tmp_path_factory) -> Path:
+    """I generated a tiny raw dataset in a scratch directory that sees the repo's SQL."""
+    path = tmp_path_factory.mktemp("warehouse")
+    (path / "pipelines").symlink_to(REPO_ROOT / "pipelines")
+    _run("generate_raw_data.py", path, **TINY_DATASET)
+    return path
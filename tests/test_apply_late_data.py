@@ -0,0 +1,162 @@
+"""
+I checked that late leads and purchases applied by delta leave silver, the
+mart, the sampled mart, and gold.agg_funnel_daily exactly as a full build
+with those rows would, that re-applying a batch is a no-op, that rows past
+the lateness horizon wait for the next rebuild, and that a failed batch
+leaves nothing landed.
+"""
+
+from __future__ import annotations
+
+import json
+import shutil
+from pathlib import Path
+
+import duckdb
+import pytest
+
+import apply_late_data
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+# Leads and purchases after this quantile of their timestamps arrive late.
+WITHHELD_QUANTILE = 0.8
+
+TABLES = [
+    "silver.fact_lead",
+    "silver.fact_purchase",
+    "gold.mart_funnel_journey",
+    "gold.mart_funnel_journey_sample",
+    "gold.agg_funnel_daily",
+]
+
+LATE_SOURCES = {"leads": "lead_ts", "purchases": "purchase_ts"}
+
+
+def _fingerprints(db_path: Path) -> dict:
+    con = duckdb.connect(str(db_path), read_only=True)
+    try:
+        return {
+            table: con.execute(f"select count(*), sum(hash(t)) from {table} t").fetchone()
+            for table in TABLES
+        }
+    finally:
+        con.close()
+
+
+def _report(path: Path) -> dict:
+    with open(path / apply_late_data.REPORT_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="module")
+def full_db(workdir: Path, run_script, tmp_path_factory) -> Path:
+    db_path = tmp_path_factory.mktemp("full") / "full.duckdb"
+    run_script("build_warehouse.py", workdir, NAV_DB_PATH=str(db_path))
+    return db_path
+
+
+@pytest.fixture
+def withheld(workdir: Path, run_script, tmp_path: Path) -> tuple:
+    """I built a warehouse without the latest leads and purchases and returned it with the late files."""
+    path = tmp_path / "warehouse"
+    (path / "data" / "raw").mkdir(parents=True)
+    (path / "pipelines").symlink_to(REPO_ROOT / "pipelines")
+    incoming = tmp_path / "incoming"
+    incoming.mkdir()
+
+    con = duckdb.connect()
+    for raw in (workdir / "data" / "raw").glob("*.parquet"):
+        shutil.copy(raw, path / "data" / "raw" / raw.name)
+    late = {}
+    for source, ts in LATE_SOURCES.items():
+        full = str(workdir / "data" / "raw" / f"raw_{source}.parquet")
+        cutoff = con.execute(
+            f"select quantile_disc({ts}, ?) from read_parquet(?)", [WITHHELD_QUANTILE, full]
+        ).fetchone()[0]
+        late[source] = incoming / f"raw_{source}.parquet"
+        con.execute(f"copy (from read_parquet('{full}') where {ts} > ?) to '{late[source]}'", [cutoff])
+        con.execute(
+            f"copy (from read_parquet('{full}') where {ts} <= ?) to '{path / 'data' / 'raw' / f'raw_{source}.parquet'}'",
+            [cutoff],
+        )
+    con.close()
+
+    run_script("build_warehouse.py", path)
+    return path, late
+
+
+def _apply(run_script, path: Path, late: dict, horizon_days: int) -> dict:
+    run_script(
+        "apply_late_data.py",
+        path,
+        NAV_LATE_LEADS=str(late["leads"]),
+        NAV_LATE_PURCHASES=str(late["purchases"]),
+        NAV_LATENESS_HORIZON_DAYS=str(horizon_days),
+    )
+    return _report(path)
+
+
+def test_late_batch_matches_full_build(withheld: tuple, full_db: Path, run_script) -> None:
+    path, late = withheld
+    db_path = path / apply_late_data.DB_PATH
+    assert _fingerprints(db_path) != _fingerprints(full_db)
+
+    first = _apply(run_script, path, late, horizon_days=400)
+    for source in first["sources"].values():
+        assert source["received"] > 0
+        assert source["applied"] == source["received"]
+        assert (path / source["landed"]).exists()
+    assert first["gold"]["journeys_changed"] > 0
+    assert _fingerprints(db_path) == _fingerprints(full_db)
+
+    # The same batch again is skipped row for row and changes nothing.
+    second = _apply(run_script, path, late, horizon_days=400)
+    for source in second["sources"].values():
+        assert source["duplicates_skipped"] == source["received"]
+        assert source["landed"] is None
+    assert second["gold"]["journeys_changed"] == 0
+    assert _fingerprints(db_path) == _fingerprints(full_db)
+
+
+def test_rows_past_horizon_wait_for_rebuild(withheld: tuple, full_db: Path, run_script) -> None:
+    path, late = withheld
+    db_path = path / apply_late_data.DB_PATH
+
+    report = _apply(run_script, path, late, horizon_days=7)
+    leads = report["sources"]["lead"]
+    assert leads["past_horizon"] > 0
+    assert leads["applied"] > 0
+
+    con = duckdb.connect(str(db_path), read_only=True)
+    past_ids = [row["id"] for row in leads["past_horizon_rows"]]
+    in_silver, in_bronze = con.execute("""
+        select
+          (select count(*) from silver.fact_lead where lead_id in (select unnest($ids))),
+          (select count(*) from bronze.raw_leads where lead_id in (select unnest($ids)))
+    """, {"ids": past_ids}).fetchone()
+    con.close()
+    assert in_silver == 0
+    assert in_bronze == len(past_ids)
+
+    # The landed files carry the held-back rows into the next full build.
+    run_script("build_warehouse.py", path)
+    assert _fingerprints(db_path) == _fingerprints(full_db)
+
+
+def test_failed_batch_removes_landed_file(withheld: tuple, monkeypatch) -> None:
+    path, late = withheld
+    before = _fingerprints(path / apply_late_data.DB_PATH)
+
+    def fail(con, staged):
+        raise RuntimeError("gold update failed")
+
+    monkeypatch.chdir(path)
+    monkeypatch.setattr(apply_late_data, "LATE_LEADS", str(late["leads"]))
+    monkeypatch.setattr(apply_late_data, "LATE_PURCHASES", str(late["purchases"]))
+    monkeypatch.setattr(apply_late_data, "_apply_to_gold", fail)
+    with pytest.raises(RuntimeError, match="gold update failed"):
+        apply_late_data.main()
+
+    assert not list((path / apply_late_data.LANDING_DIR).glob("*.parquet"))
+    assert _fingerprints(path / apply_late_data.DB_PATH) == before
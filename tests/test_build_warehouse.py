@@ -0,0 +1,80 @@
+"""
+I checked that a resource-governed build completes under a constrained
+memory limit by falling back to actor-hash buckets, and that the bucketed
+mart matches an unconstrained build row for row. I also checked that spill
+settings apply without a memory limit and that overrides for unknown models
+are rejected.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import duckdb
+import pytest
+
+import build_warehouse
+
+MART_MEMORY_LIMIT = "20MB"
+
+
+def _mart_fingerprint(db_path: Path) -> tuple:
+    con = duckdb.connect(str(db_path), read_only=True)
+    try:
+        return con.execute(
+            "select count(*), sum(hash(journey_id)) from gold.mart_funnel_journey"
+        ).fetchone()
+    finally:
+        con.close()
+
+
+def test_constrained_build_falls_back_to_buckets(workdir: Path, run_script) -> None:
+    unconstrained_db = workdir / "unconstrained.duckdb"
+    run_script("build_warehouse.py", workdir, NAV_DB_PATH=str(unconstrained_db))
+
+    constrained_db = workdir / "constrained.duckdb"
+    out = run_script(
+        "build_warehouse.py",
+        workdir,
+        NAV_DB_PATH=str(constrained_db),
+        NAV_MEMORY_LIMIT="200MB",
+        NAV_THREADS="2",
+        NAV_MODEL_MEMORY_LIMITS=f"gold.mart_funnel_journey={MART_MEMORY_LIMIT}",
+    )
+
+    assert "Rebuilt gold.mart_funnel_journey in" in out
+    assert _mart_fingerprint(constrained_db) == _mart_fingerprint(unconstrained_db)
+
+
+def test_overrides_must_name_sql_models() -> None:
+    models = build_warehouse._sql_models()
+    assert {"silver.fact_events", "gold.mart_funnel_journey"} <= models
+
+    assert build_warehouse._parse_overrides("gold.mart_funnel_journey=2GB", models) == {
+        "gold.mart_funnel_journey": "2GB"
+    }
+    with pytest.raises(ValueError, match="gold.mart_funnel_journy"):
+        build_warehouse._parse_overrides("gold.mart_funnel_journy=2GB", models)
+
+
+def test_spill_settings_apply_without_memory_limit(tmp_path: Path, monkeypatch) -> None:
+    monkeypatch.setattr(build_warehouse, "MEMORY_LIMIT", None)
+    monkeypatch.setattr(build_warehouse, "TEMP_DIR", str(tmp_path / "spill"))
+    monkeypatch.setattr(build_warehouse, "MAX_TEMP_DIR_SIZE", "1GB")
+    reference = duckdb.connect()
+    reference.execute("set max_temp_directory_size = '1GB';")
+    expected_size, default_limit = reference.execute(
+        "select current_setting('max_temp_directory_size'), current_setting('memory_limit')"
+    ).fetchone()
+    con = duckdb.connect()
+
+    build_warehouse._configure(con)
+
+    temp_dir, max_size, memory_limit = con.execute("""
+        select current_setting('temp_directory'), current_setting('max_temp_directory_size'),
+               current_setting('memory_limit')
+    """).fetchone()
+    assert temp_dir == str(tmp_path / "spill")
+    assert (tmp_path / "spill").is_dir()
+    assert max_size == expected_size
+    assert memory_limit == default_limit
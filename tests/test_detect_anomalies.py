@@ -0,0 +1,175 @@
+"""
+I checked that the anomaly detector can fold new days into baselines that
+were loaded from dq.rate_baselines, and that lead and conversion rates are
+counted per cohort rather than per calendar day.
+"""
+
+from __future__ import annotations
+
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "pipelines" / "python"))
+
+import detect_anomalies  # noqa: E402
+
+KEY = ("approval_rate", "retail", "prime", "(all)")
+
+
+def test_score_days_updates_loaded_state() -> None:
+    state = pd.DataFrame([{
+        **dict(zip(detect_anomalies.SLICE_COLUMNS, KEY)),
+        "n_days": 3,
+        "ewma_rate": 0.5,
+        "ewma_var": 0.01,
+        "dow_history": [np.nan] * (7 * detect_anomalies.SEASONAL_WEEKS),
+        "last_date": date(2026, 1, 1),
+    }])
+    history = np.full((1, 7, detect_anomalies.SEASONAL_WEEKS), np.nan)
+    counts = pd.DataFrame([{
+        "metric_date": pd.Timestamp("2026-01-02"),
+        **dict(zip(detect_anomalies.SLICE_COLUMNS, KEY)),
+        "numerator": 7,
+        "denominator": 10,
+    }])
+
+    new_state, alerts = detect_anomalies.score_days(state, {KEY: 0}, history, counts)
+
+    row = new_state.iloc[0]
+    assert row["n_days"] == 4
+    assert row["ewma_rate"] == pytest.approx(0.5 + detect_anomalies.EWMA_ALPHA * 0.2)
+    assert row["last_date"] == date(2026, 1, 2)
+    assert alerts.empty
+    # The caller's state frame is left untouched.
+    assert state.loc[0, "n_days"] == 3
+
+
+def test_rates_are_attributed_to_their_cohort_day() -> None:
+    con = duckdb.connect()
+    con.execute("create schema silver;")
+    con.execute("""
+        create table silver.dim_customer as
+        select * from (values ('c1', 'retail', 'prime'), ('c2', 'retail', 'prime'))
+          t(customer_id, segment, credit_score_band);
+    """)
+    con.execute("""
+        create table silver.fact_eligibility_decision as
+        select customer_id, cast(decision_ts as timestamp) as decision_ts, approved_flag
+        from (values ('c1', '2026-01-05 10:00', true), ('c2', '2026-01-05 11:00', true))
+          t(customer_id, decision_ts, approved_flag);
+    """)
+    # c1's lead follows the decision the next day; c2 never raises one.
+    con.execute("""
+        create table silver.fact_lead as
+        select lead_id, customer_id, vehicle_id, cast(lead_ts as timestamp) as lead_ts, campaign_id
+        from (values ('l1', 'c1', 'v1', '2026-01-06 09:00', 'spring'))
+          t(lead_id, customer_id, vehicle_id, lead_ts, campaign_id);
+    """)
+    # The purchase lands on a day with no leads, days after its lead.
+    con.execute("""
+        create table silver.fact_purchase as
+        select customer_id, vehicle_id, cast(purchase_ts as timestamp) as purchase_ts
+        from (values ('c1', 'v1', '2026-01-10 15:00')) t(customer_id, vehicle_id, purchase_ts);
+    """)
+
+    rates = {
+        (r.metric, r.metric_date.date()): (r.numerator, r.denominator)
+        for metric in detect_anomalies.METRICS
+        for r in detect_anomalies.counts(con, metric, date(2026, 1, 1), date(2026, 3, 1)).itertuples()
+    }
+
+    assert rates[("lead_rate", date(2026, 1, 5))] == (1, 2)
+    assert rates[("conversion_rate", date(2026, 1, 6))] == (1, 1)
+    assert not any(metric == "conversion_rate" and day == date(2026, 1, 10) for metric, day in rates)
+
+
+def _silver(con: duckdb.DuckDBPyConnection) -> None:
+    """I generated 60 days of decisions, same-day leads, and purchases three days later."""
+    con.execute("create schema silver;")
+    con.execute("""
+        create table silver.dim_customer as
+        select 'c' || i as customer_id, 'retail' as segment, 'prime' as credit_score_band
+        from range(20) t(i);
+    """)
+    con.execute("""
+        create table main.decisions as
+        select 'c' || i as customer_id, timestamp '2026-01-01 10:00' + to_days(d) as decision_ts,
+               (i + d) % 3 > 0 as approved_flag
+        from range(60) a(d), range(20) b(i);
+    """)
+    con.execute("""
+        create table main.leads as
+        select 'l' || d || '_' || i as lead_id, 'c' || i as customer_id, 'v' || d as vehicle_id,
+               timestamp '2026-01-01 11:00' + to_days(d) as lead_ts, 'spring' as campaign_id
+        from range(60) a(d), range(20) b(i)
+        where (i + d) % 2 = 0;
+    """)
+    con.execute("""
+        create table main.purchases as
+        select customer_id, vehicle_id, lead_ts + to_days(3) as purchase_ts
+        from main.leads
+        where hash(lead_id) % 3 = 0;
+    """)
+    con.execute("create table silver.fact_eligibility_decision as from main.decisions limit 0;")
+    con.execute("create table silver.fact_lead as from main.leads limit 0;")
+    con.execute("create table silver.fact_purchase as from main.purchases limit 0;")
+
+
+def _load_until(con: duckdb.DuckDBPyConnection, day: date) -> None:
+    for table, source, ts in [
+        ("silver.fact_eligibility_decision", "main.decisions", "decision_ts"),
+        ("silver.fact_lead", "main.leads", "lead_ts"),
+        ("silver.fact_purchase", "main.purchases", "purchase_ts"),
+    ]:
+        con.execute(f"delete from {table};")
+        con.execute(f"insert into {table} from {source} where {ts} < ?;", [day])
+
+
+def _latest_state(con: duckdb.DuckDBPyConnection) -> list:
+    return con.execute("""
+        select * exclude (dow_history), list_transform(dow_history, x -> round(x, 9))
+        from dq.rate_baselines
+        where (metric, as_of) in (select (metric, max(as_of)) from dq.anomaly_checkpoints group by metric)
+        order by all
+    """).fetchall()
+
+
+def test_run_rescores_only_cohorts_touched_by_late_rows() -> None:
+    con = duckdb.connect()
+    _silver(con)
+
+    for day in range(25, 60):
+        _load_until(con, date(2026, 1, 1) + timedelta(days=day))
+        detect_anomalies.run(con)
+
+    # A reload with identical contents scores nothing and rewinds nothing.
+    con.execute("create or replace table silver.fact_lead as from silver.fact_lead;")
+    again = detect_anomalies.run(con)
+    assert sum(again["days_scored"].values()) == 0
+    assert again["rescored_from"] == {}
+
+    # A late purchase for a February 8 lead only rewinds conversion rate, and
+    # only to the checkpoint before the purchase day.
+    lead = con.execute("""
+        select customer_id, vehicle_id from silver.fact_lead l
+        where cast(lead_ts as date) = date '2026-02-08'
+          and not exists (select 1 from silver.fact_purchase p
+                          where p.customer_id = l.customer_id and p.vehicle_id = l.vehicle_id)
+        limit 1
+    """).fetchone()
+    con.execute(
+        "insert into silver.fact_purchase values (?, ?, timestamp '2026-02-10 09:00');", list(lead))
+    late = detect_anomalies.run(con)
+    assert late["rescored_from"] == {"conversion_rate": date(2026, 2, 10)}
+
+    incremental = _latest_state(con)
+    assert len(incremental) > 0
+    con.execute("drop schema dq cascade;")
+    detect_anomalies.run(con)
+    assert _latest_state(con) == incremental
@@ -0,0 +1,102 @@
+"""
+I checked that repeat exports only rewrite changed partitions, remove
+partitions that left the mart, handle NULL variants, and keep the manifest's
+checksums in step with the files on disk.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import duckdb
+import pytest
+
+import export_gold
+
+
+def _manifest(export_dir: Path) -> dict:
+    with open(export_dir / export_gold.MANIFEST_NAME, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _assert_manifest_matches_disk(export_dir: Path) -> None:
+    on_disk = {
+        os.path.relpath(os.path.join(root, name), export_dir)
+        for root, _, names in os.walk(export_dir)
+        for name in names
+        if name != export_gold.MANIFEST_NAME
+    }
+    files = _manifest(export_dir)["files"]
+    assert set(files) == on_disk
+    for rel_path, checksum in files.items():
+        assert hashlib.sha256((export_dir / rel_path).read_bytes()).hexdigest() == checksum
+
+
+def _exported_mart(con: duckdb.DuckDBPyConnection, export_dir: Path) -> tuple:
+    return con.execute("""
+        select count(*), count(*) filter (where variant is null), sum(hash(journey_id))
+        from read_parquet(?, hive_partitioning = true, hive_types = {'variant': varchar})
+    """, [str(export_dir / export_gold.MART_DIR / "**" / "*.parquet")]).fetchone()
+
+
+@pytest.fixture
+def con(workdir: Path, run_script, tmp_path: Path):
+    db_path = tmp_path / "export.duckdb"
+    run_script("build_warehouse.py", workdir, NAV_DB_PATH=str(db_path))
+    con = duckdb.connect(str(db_path))
+    yield con
+    con.close()
+
+
+def test_incremental_export(con: duckdb.DuckDBPyConnection, tmp_path: Path) -> None:
+    export_dir = tmp_path / "exports"
+    mart = export_gold.MART
+
+    first = export_gold.export_gold(con, str(export_dir))
+    assert first["partitions_written"] == first["partitions_total"]
+    assert first["partitions_removed"] == 0
+    assert (export_dir / "kpis" / "vw_experiment_readout").is_dir()
+    _assert_manifest_matches_disk(export_dir)
+
+    assert export_gold.export_gold(con, str(export_dir))["partitions_written"] == 0
+
+    # One changed partition, two deleted ones, and a new NULL-variant journey.
+    partitions = con.execute(f"""
+        select cast(first_browse_ts as date) as event_date, variant
+        from {mart} where variant is not null
+        group by 1, 2 order by 1, 2 limit 3
+    """).fetchall()
+    (changed_date, changed_variant), *deleted = partitions
+    con.execute(
+        f"update {mart} set purchase_price = coalesce(purchase_price, 0) + 1 "
+        "where cast(first_browse_ts as date) = ? and variant = ?",
+        [changed_date, changed_variant],
+    )
+    for event_date, variant in deleted:
+        con.execute(
+            f"delete from {mart} where cast(first_browse_ts as date) = ? and variant = ?",
+            [event_date, variant],
+        )
+    con.execute(f"""
+        insert into {mart}
+        select * replace ('null-variant-journey' as journey_id, null as variant)
+        from {mart} where cast(first_browse_ts as date) = ? and variant = ?
+        limit 1
+    """, [changed_date, changed_variant])
+
+    second = export_gold.export_gold(con, str(export_dir))
+    assert second["partitions_written"] == 2
+    assert second["partitions_removed"] == 2
+    assert second["partitions_total"] == first["partitions_total"] - 1
+    _assert_manifest_matches_disk(export_dir)
+    for event_date, variant in deleted:
+        assert not (export_dir / export_gold.MART_DIR / f"event_date={event_date}" / f"variant={variant}").exists()
+
+    exported = _exported_mart(con, export_dir)
+    assert exported == con.execute(
+        f"select count(*), count(*) filter (where variant is null), sum(hash(journey_id)) from {mart}"
+    ).fetchone()
+    assert exported[1] >= 1